@@ -0,0 +1,146 @@
+import com.garmin.fit.*;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.OutputStream;
+import java.util.ArrayList;
+import java.util.Date;
+import java.util.Random;
+
+/**
+ * Generador de archivos FIT de workout con el SDK de Java de Garmin.
+ *
+ * Se compila una sola vez y recibe la rutina por argumentos:
+ *
+ *   java FitWorkoutGenerator <salida.fit> <nombre_rutina>
+ *        [<nombre_paso> <tipo_duracion> <valor_duracion> <tipo_objetivo> <valor_objetivo>]...
+ *
+ * Los tipos son nombres de las constantes WktStepDuration / WktStepTarget (TIME, OPEN, ...).
+ * Si la salida es "-", el archivo FIT se escribe en stdout y los mensajes van a stderr.
+ */
+class FitWorkoutGenerator {
+
+    private static final int STEP_ARGS = 5;
+
+    public static void main(String[] args) {
+        if (args.length < 2 || (args.length - 2) % STEP_ARGS != 0) {
+            System.err.println("Uso: FitWorkoutGenerator <salida.fit> <nombre_rutina> "
+                    + "[<nombre> <tipo_duracion> <valor_duracion> <tipo_objetivo> <valor_objetivo>]...");
+            System.exit(2);
+        }
+
+        try {
+            createWorkout(args);
+            System.err.println("Archivo FIT generado exitosamente");
+        } catch (Exception e) {
+            System.err.println("Error: " + e.getMessage());
+            e.printStackTrace();
+            System.exit(1);
+        }
+    }
+
+    public static void createWorkout(String[] args) throws IOException {
+        String filename = args[0];
+        String routineName = args[1];
+
+        ArrayList<WorkoutStepMesg> workoutSteps = new ArrayList<WorkoutStepMesg>();
+
+        for (int i = 2; i < args.length; i += STEP_ARGS) {
+            workoutSteps.add(CreateWorkoutStep(
+                    workoutSteps.size(),
+                    args[i],
+                    null,
+                    Intensity.ACTIVE,
+                    WktStepDuration.valueOf(args[i + 1]),
+                    Integer.valueOf(args[i + 2]),
+                    WktStepTarget.valueOf(args[i + 3]),
+                    Integer.parseInt(args[i + 4])));
+        }
+
+        WorkoutMesg workoutMesg = new WorkoutMesg();
+        workoutMesg.setWktName(routineName);
+        workoutMesg.setSport(Sport.GENERIC);
+        workoutMesg.setSubSport(SubSport.INVALID);
+        workoutMesg.setNumValidSteps(workoutSteps.size());
+
+        CreateWorkout(workoutMesg, workoutSteps, filename);
+    }
+
+    public static void CreateWorkout(WorkoutMesg workoutMesg, ArrayList<WorkoutStepMesg> workoutSteps, String filename)
+            throws IOException {
+        // The combination of file type, manufacturer id, product id, and serial number should be unique.
+        File filetype = File.WORKOUT;
+        short manufacturerId = Manufacturer.DEVELOPMENT;
+        short productId = 0;
+        Random random = new Random();
+        int serialNumber = random.nextInt();
+
+        // Every FIT file MUST contain a File ID message
+        FileIdMesg fileIdMesg = new FileIdMesg();
+        fileIdMesg.setType(filetype);
+        fileIdMesg.setManufacturer((int) manufacturerId);
+        fileIdMesg.setProduct((int) productId);
+        fileIdMesg.setTimeCreated(new DateTime(new Date()));
+        fileIdMesg.setSerialNumber((long) serialNumber);
+
+        // Encode in memory; the whole file is written out in one go below
+        BufferEncoder encode = new BufferEncoder(Fit.ProtocolVersion.V1_0);
+
+        // Write the messages to the buffer, in the proper sequence
+        encode.write(fileIdMesg);
+        encode.write(workoutMesg);
+
+        for (WorkoutStepMesg workoutStep : workoutSteps) {
+            encode.write(workoutStep);
+        }
+
+        byte[] fitData = encode.close();
+
+        if (filename.equals("-")) {
+            System.out.write(fitData);
+            System.out.flush();
+        } else {
+            try (OutputStream out = new FileOutputStream(filename)) {
+                out.write(fitData);
+            }
+        }
+
+        System.err.println("Encoded FIT Workout File " + filename);
+    }
+
+    private static WorkoutStepMesg CreateWorkoutStep(int messageIndex,
+                                                     String name,
+                                                     String notes,
+                                                     Intensity intensity,
+                                                     WktStepDuration durationType,
+                                                     Integer durationValue,
+                                                     WktStepTarget targetType,
+                                                     int targetValue) {
+
+        WorkoutStepMesg workoutStepMesg = new WorkoutStepMesg();
+        workoutStepMesg.setMessageIndex(messageIndex);
+
+        if (name != null) {
+            workoutStepMesg.setWktStepName(name);
+        }
+
+        if (notes != null) {
+            workoutStepMesg.setNotes(notes);
+        }
+
+        if (durationType == WktStepDuration.INVALID) {
+            return null;
+        }
+
+        workoutStepMesg.setIntensity(intensity);
+        workoutStepMesg.setDurationType(durationType);
+
+        if (durationValue != null) {
+            workoutStepMesg.setDurationValue((long) durationValue);
+        }
+
+        workoutStepMesg.setTargetType(targetType);
+        workoutStepMesg.setTargetValue((long) targetValue);
+
+        return workoutStepMesg;
+    }
+}
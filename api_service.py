@@ -5,12 +5,18 @@ Desplegado en Render.com
 """
 
 import os
-import sys
-import json
-import tempfile
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_file
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import quote
+from flask import Flask, Response, request, jsonify
+from werkzeug.exceptions import HTTPException
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from flask_cors import CORS
+import orjson
 import logging
 
 # Configurar logging
@@ -20,9 +26,46 @@ logger = logging.getLogger(__name__)
 # Importar el wrapper de Java
 from fit_java_wrapper import FitJavaWrapper
 
+# Campos requeridos de la rutina y su tipo JSON esperado
+ROUTINE_SCHEMA = {
+    'routine_name': str,
+    'steps': list,
+}
+
+# Número de archivos FIT generados que se mantienen en memoria
+FIT_CACHE_SIZE = 128
+
+# Tamaño máximo del cuerpo JSON de una rutina (bytes)
+MAX_ROUTINE_SIZE = 64 * 1024
+
+# Segundos que el cliente puede reutilizar un archivo FIT descargado
+FIT_CACHE_MAX_AGE = 300
+
+# Algoritmos de flask-compress; al comprimir añade ":<algoritmo>" al ETag
+COMPRESS_ALGORITHMS = ['br', 'gzip', 'deflate']
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask basado en orjson (parseo y serialización en C)"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = MAX_ROUTINE_SIZE
 CORS(app)  # Permitir CORS para llamadas desde WordPress
 
+# Comprimir (gzip/brotli) también los archivos FIT, que son muy compresibles
+app.config['COMPRESS_MIMETYPES'] = [
+    'application/json',
+    'application/octet-stream',
+]
+app.config['COMPRESS_ALGORITHM'] = COMPRESS_ALGORITHMS
+Compress(app)
+
 # Inicializar el wrapper de Java
 try:
     fit_wrapper = FitJavaWrapper()
@@ -51,53 +94,120 @@ def generate_fit():
             return jsonify({'error': 'No se recibieron datos'}), 400
         
         # Validar datos requeridos
-        required_fields = ['routine_name', 'steps']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Campo requerido: {field}'}), 400
+        error = validate_routine(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        routine_name = data['routine_name']
+        logger.info(f"Generando FIT para rutina: {routine_name}")
         
-        logger.info(f"Generando FIT para rutina: {data['routine_name']}")
+        # Las rutinas idénticas comparten clave de caché y ETag
+        payload_json = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+        etag = hashlib.blake2b(payload_json, digest_size=16).hexdigest()
         
-        # Generar archivo FIT
-        fit_file_path = generate_fit_file(data)
+        matched_etag = matching_etag(etag)
+        if matched_etag:
+            response = Response(status=304)
+            set_cache_headers(response, matched_etag)
+            return response
         
-        if not fit_file_path or not os.path.exists(fit_file_path):
+        # Generar archivo FIT (o reutilizar el ya generado)
+        try:
+            fit_data = generate_fit_file_cached(etag, data)
+        except RuntimeError:
             return jsonify({'error': 'Error generando archivo FIT'}), 500
         
-        # Enviar archivo
-        return send_file(
-            fit_file_path,
-            as_attachment=True,
-            download_name=f"{data['routine_name']}.fit",
-            mimetype='application/octet-stream'
-        )
+        # Enviar archivo desde memoria, sin pasar por send_file
+        response = Response(fit_data, mimetype='application/octet-stream')
+        set_attachment_header(response.headers, f"{routine_name}.fit")
+        set_cache_headers(response, etag)
+        return response
         
+    except HTTPException as e:
+        # Errores de cliente de Werkzeug (JSON inválido, cuerpo demasiado grande), también en JSON
+        return jsonify({'error': e.description}), e.code
     except Exception as e:
         logger.error(f"Error en generate_fit: {str(e)}")
         return jsonify({'error': f'Error interno: {str(e)}'}), 500
 
+def validate_routine(data):
+    """Validar la estructura de la rutina; devuelve el mensaje de error o None"""
+    if not isinstance(data, dict):
+        return 'Se esperaba un objeto JSON'
+    
+    for field, expected_type in ROUTINE_SCHEMA.items():
+        if field not in data:
+            return f'Campo requerido: {field}'
+        if not isinstance(data[field], expected_type):
+            return f'Tipo inválido para el campo: {field}'
+    
+    if not all(isinstance(step, dict) for step in data['steps']):
+        return 'Cada paso debe ser un objeto JSON'
+    
+    return None
+
+def matching_etag(etag):
+    """Devolver la variante del ETag (sin comprimir o comprimida) que trae If-None-Match, o None"""
+    for candidate in [etag] + [f'{etag}:{algorithm}' for algorithm in COMPRESS_ALGORITHMS]:
+        if request.if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+def set_cache_headers(response, etag):
+    """Añadir ETag y Cache-Control a la descarga (también a las respuestas 304)"""
+    # ETag débil: el generador Java cambia número de serie y fecha en cada archivo
+    response.set_etag(etag, weak=True)
+    response.cache_control.public = True
+    response.cache_control.max_age = FIT_CACHE_MAX_AGE
+
+def set_attachment_header(headers, filename):
+    """Añadir la cabecera Content-Disposition de descarga, igual que send_file (RFC 6266)"""
+    # Nombre ASCII sin tildes para clientes antiguos y nombre UTF-8 completo en filename*
+    options = {'filename': unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')}
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        options['filename*'] = f"UTF-8''{quote(filename, safe='!#$&+-.^_`|~')}"
+    
+    # Headers.set se encarga de entrecomillar y escapar los valores
+    headers.set('Content-Disposition', 'attachment', **options)
+
 def generate_fit_file(routine_data):
-    """Generar archivo FIT de workout usando el wrapper de Java"""
+    """Generar archivo FIT de workout usando el wrapper de Java y devolver su contenido"""
     try:
         if not fit_wrapper:
             raise Exception("FitJavaWrapper no está disponible")
         
-        # Crear archivo temporal
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.fit')
-        temp_file.close()
-        
-        # Usar el wrapper de Java para generar el archivo FIT
-        result_path = fit_wrapper.create_workout_fit(routine_data, temp_file.name)
-        
-        if result_path and os.path.exists(result_path):
-            return result_path
-        else:
-            raise Exception("El wrapper de Java no pudo generar el archivo FIT")
+        # El SDK de Java entrega el archivo por stdout, sin archivos temporales
+        return fit_wrapper.create_workout_fit_bytes(routine_data)
         
     except Exception as e:
         logger.error(f"Error generando FIT: {str(e)}")
         return None
 
+# Archivos FIT generados por ETag de la rutina, del más antiguo al más reciente
+_fit_cache = OrderedDict()
+_fit_cache_lock = threading.Lock()
+
+def generate_fit_file_cached(etag, routine_data):
+    """Generar archivo FIT de la rutina, reutilizando el guardado para el mismo ETag"""
+    with _fit_cache_lock:
+        fit_data = _fit_cache.get(etag)
+        if fit_data is not None:
+            _fit_cache.move_to_end(etag)
+            return fit_data
+    
+    fit_data = generate_fit_file(routine_data)
+    if not fit_data:
+        # Los fallos no se guardan en la caché
+        raise RuntimeError("No se pudo generar el archivo FIT")
+    
+    with _fit_cache_lock:
+        _fit_cache[etag] = fit_data
+        if len(_fit_cache) > FIT_CACHE_SIZE:
+            _fit_cache.popitem(last=False)
+    return fit_data
+
 @app.route('/test', methods=['GET'])
 def test_endpoint():
     """Endpoint de prueba para verificar la generación de archivos FIT"""
@@ -120,23 +230,6 @@ def test_endpoint():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-def parse_duration(duration_str):
-    """Convertir duración de string a segundos"""
-    try:
-        return int(duration_str)
-    except ValueError:
-        return 60
-
-def map_intensity(step_type):
-    """Mapear tipo de paso a intensidad FIT"""
-    intensity_map = {
-        'warmup': 1,    # Warmup
-        'cooldown': 2,  # Cooldown
-        'run': 0,       # Active
-        'rest': 3,      # Rest
-    }
-    return intensity_map.get(step_type.lower(), 0)
-
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     logger.info(f"Iniciando servidor Flask en puerto {port}")
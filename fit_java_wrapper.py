@@ -5,15 +5,89 @@ Permite crear archivos FIT válidos usando el SDK oficial de Java
 """
 
 import os
+import shutil
 import subprocess
 import tempfile
-import json
+import threading
 import logging
-from datetime import datetime
 from typing import List, Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# Programa Java estático que genera el archivo FIT a partir de argumentos
+JAVA_SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FitWorkoutGenerator.java")
+JAVA_CLASS_NAME = "FitWorkoutGenerator"
+
+# Directorio donde el build (Dockerfile / render.yaml) deja la clase ya compilada
+JAVA_CLASSES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "java_classes")
+
+# Tipo de paso (en minúsculas) -> constante WktStepDuration del SDK de Java
+STEP_DURATION_TYPES = {
+    'time': "TIME",
+    'distance': "DISTANCE",
+    'reps': "REPS",
+    'repetitions': "REPS",
+}
+
+# Instalación de Java usada en Render cuando no está en el PATH
+DEFAULT_JAVA_HOME = "/usr/lib/jvm/java-11-openjdk-amd64"
+
+# Procesos java simultáneos por proceso de Python; cada JVM ocupa 50 MB o más
+JAVA_MAX_PROCESSES = int(os.environ.get('JAVA_MAX_PROCESSES', 2))
+_java_slots = threading.BoundedSemaphore(JAVA_MAX_PROCESSES)
+
+# Segundos máximos de espera a java (por archivo) y a javac; con workers gthread el
+# timeout de gunicorn no mata una petición colgada
+JAVA_TIMEOUT = int(os.environ.get('JAVA_TIMEOUT', 30))
+JAVAC_TIMEOUT = int(os.environ.get('JAVAC_TIMEOUT', 120))
+
+
+def find_java_tool(name: str) -> Optional[str]:
+    """
+    Buscar un ejecutable de Java (java, javac) sin ejecutarlo
+    
+    Args:
+        name: Nombre del ejecutable
+    
+    Returns:
+        Optional[str]: Ruta del ejecutable, o None si no se encuentra
+    """
+    path = shutil.which(name)
+    if path:
+        return path
+    
+    # Probar JAVA_HOME y la ruta fija de Render
+    for java_home in (os.environ.get('JAVA_HOME'), DEFAULT_JAVA_HOME):
+        if java_home:
+            candidate = os.path.join(java_home, 'bin', name)
+            if os.access(candidate, os.X_OK):
+                return candidate
+    return None
+
+
+def run_java_tool(cmd: List[str], stdout: int, timeout: float) -> tuple:
+    """
+    Ejecutar java/javac y esperar a que termine, como mucho timeout segundos
+    
+    Args:
+        cmd: Comando a ejecutar
+        stdout: Destino de stdout (subprocess.PIPE o subprocess.DEVNULL)
+        timeout: Segundos máximos de espera
+    
+    Returns:
+        tuple: (returncode, stdout, stderr), con la salida en bytes
+    """
+    process = subprocess.Popen(cmd, stdout=stdout, stderr=subprocess.PIPE)
+    try:
+        out, err = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # Matar el proceso colgado y recogerlo para no dejar un zombi
+        process.kill()
+        process.communicate()
+        raise RuntimeError(f"{os.path.basename(cmd[0])} no terminó en {timeout} segundos")
+    return process.returncode, out, err
+
+
 class FitJavaWrapper:
     """Wrapper para crear archivos FIT usando el SDK de Java de Garmin"""
     
@@ -35,26 +109,16 @@ class FitJavaWrapper:
         if not os.path.exists(self.fit_jar_path):
             raise FileNotFoundError(f"No se encontró fit.jar en {self.fit_jar_path}")
         
-        # Verificar que Java está disponible
-        try:
-            result = subprocess.run(['java', '-version'], capture_output=True, check=True, text=True)
-            logger.info(f"Java disponible: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Java falló con código {e.returncode}: {e.stderr}")
-            raise RuntimeError(f"Java no está disponible en el sistema: {e.stderr}")
-        except FileNotFoundError as e:
-            logger.error(f"Comando java no encontrado: {e}")
-            # Intentar con ruta completa
-            try:
-                java_path = "/usr/lib/jvm/java-11-openjdk-amd64/bin/java"
-                result = subprocess.run([java_path, '-version'], capture_output=True, check=True, text=True)
-                logger.info(f"Java encontrado en ruta completa: {result.stderr}")
-            except Exception as e2:
-                logger.error(f"Java no disponible en ruta completa: {e2}")
-                raise RuntimeError(f"Java no está disponible en el sistema: {e}")
-        except Exception as e:
-            logger.error(f"Error inesperado verificando Java: {e}")
-            raise RuntimeError(f"Java no está disponible en el sistema: {e}")
+        # Localizar Java sin arrancar una JVM; el primer uso real detecta cualquier fallo
+        self._java = find_java_tool('java')
+        if self._java is None:
+            logger.error("Comando java no encontrado")
+            raise RuntimeError("Java no está disponible en el sistema")
+        logger.info(f"Java disponible en: {self._java}")
+        
+        # El generador Java viene compilado del build; si no, se compila en el primer uso
+        self._classes_dir = JAVA_CLASSES_DIR if self._is_prebuilt() else None
+        self._compile_lock = threading.Lock()
         
         logger.info(f"FitJavaWrapper inicializado con fit.jar en: {self.fit_jar_path}")
     
@@ -80,67 +144,14 @@ class FitJavaWrapper:
             str: Ruta del archivo FIT generado
         """
         try:
-            # Crear archivo temporal para los datos JSON
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_json:
-                json.dump(routine_data, temp_json, indent=2)
-                json_path = temp_json.name
-            
             # Crear directorio temporal para el archivo FIT si no se especifica output_path
             if output_path is None:
                 temp_dir = tempfile.mkdtemp()
                 routine_name = routine_data.get('routine_name', 'workout').replace(' ', '_')
                 output_path = os.path.join(temp_dir, f"{routine_name}.fit")
             
-            # Crear el programa Java temporal
-            java_code = self._generate_java_code(routine_data, output_path)
-            
-            # Crear archivo Java temporal con nombre fijo
-            temp_dir = tempfile.mkdtemp()
-            java_file_path = os.path.join(temp_dir, "FitWorkoutGenerator.java")
-            with open(java_file_path, 'w') as temp_java:
-                temp_java.write(java_code)
-            
-            # Compilar el código Java
-            class_name = os.path.basename(java_file_path).replace('.java', '')
-            compile_cmd = [
-                'javac',
-                '-cp', self.fit_jar_path,
-                java_file_path
-            ]
-            
-            logger.info(f"Compilando código Java: {' '.join(compile_cmd)}")
-            compile_result = subprocess.run(compile_cmd, capture_output=True, text=True)
-            
-            if compile_result.returncode != 0:
-                logger.error(f"Error compilando Java: {compile_result.stderr}")
-                raise RuntimeError(f"Error compilando código Java: {compile_result.stderr}")
-            
-            # Ejecutar el código Java
-            class_file_dir = os.path.dirname(java_file_path)
-            class_name = os.path.splitext(os.path.basename(java_file_path))[0]
-            run_cmd = [
-                'java',
-                '-cp', f"{self.fit_jar_path}:{class_file_dir}",
-                class_name
-            ]
-            
-            logger.info(f"Ejecutando código Java: {' '.join(run_cmd)}")
-            run_result = subprocess.run(run_cmd, capture_output=True, text=True, cwd=class_file_dir)
-            
-            if run_result.returncode != 0:
-                logger.error(f"Error ejecutando Java: {run_result.stderr}")
-                raise RuntimeError(f"Error ejecutando código Java: {run_result.stderr}")
-            
+            self._run_generator(routine_data, output_path)
             logger.info(f"Archivo FIT generado exitosamente: {output_path}")
-            logger.info(f"Salida Java: {run_result.stdout}")
-            
-            # Limpiar archivos temporales
-            try:
-                os.unlink(json_path)
-                os.unlink(java_file_path)
-                os.unlink(java_file_path.replace('.java', '.class'))
-            except OSError:
-                pass  # Ignorar errores de limpieza
             
             return output_path
             
@@ -148,171 +159,158 @@ class FitJavaWrapper:
             logger.error(f"Error creando archivo FIT: {str(e)}")
             raise
     
-    def _generate_java_code(self, routine_data: Dict[str, Any], output_path: str) -> str:
+    def create_workout_fit_bytes(self, routine_data: Dict[str, Any]) -> bytes:
         """
-        Generar código Java para crear el archivo FIT
+        Crear un archivo FIT de workout en memoria, sin pasar por disco
+        
+        El generador Java escribe el archivo en stdout, que se lee directamente.
         
         Args:
-            routine_data: Datos de la rutina
-            output_path: Ruta donde guardar el archivo FIT
+            routine_data: Datos de la rutina (mismo formato que create_workout_fit)
         
         Returns:
-            str: Código Java generado
+            bytes: Contenido del archivo FIT generado
         """
-        routine_name = routine_data.get('routine_name', 'Workout')
-        steps = routine_data.get('steps', [])
-        
-        # Generar código para los pasos
-        steps_code = []
-        for i, step in enumerate(steps):
-            step_name = step.get('name', f'Step {i+1}')
-            step_type = step.get('type', 'time')
-            step_value = step.get('value', '60')
+        try:
+            fit_data = self._run_generator(routine_data, '-')
+            if not fit_data:
+                raise RuntimeError("El generador Java no devolvió datos FIT")
             
-            # Convertir tipo y valor según el formato del SDK
-            duration_type, duration_value, target_type, target_value = self._convert_step_params(step_type, step_value)
+            logger.info(f"Archivo FIT generado exitosamente en memoria ({len(fit_data)} bytes)")
+            return fit_data
             
-            step_code = f"""
-        workoutSteps.add(CreateWorkoutStep(
-                {i},
-                "{step_name}",
-                null,
-                Intensity.ACTIVE,
-                {duration_type},
-                {duration_value},
-                {target_type},
-                {target_value}));"""
-            steps_code.append(step_code)
+        except Exception as e:
+            logger.error(f"Error creando archivo FIT: {str(e)}")
+            raise
+    
+    def _run_generator(self, routine_data: Dict[str, Any], output_path: str) -> bytes:
+        """
+        Ejecutar el generador Java ya compilado, pasando la rutina por argumentos
         
-        steps_code_str = '\n'.join(steps_code)
+        Args:
+            routine_data: Datos de la rutina
+            output_path: Ruta del archivo FIT, o "-" para recibirlo por stdout
         
-        java_code = f"""
-import com.garmin.fit.*;
-import java.util.ArrayList;
-import java.util.Date;
-import java.util.Random;
-
-class FitWorkoutGenerator {{
+        Returns:
+            bytes: Archivo FIT si output_path es "-"; vacío en otro caso
+        """
+        classes_dir = self._ensure_compiled()
+        run_cmd = [
+            self._java,
+            '-cp', f"{self.fit_jar_path}{os.pathsep}{classes_dir}",
+            JAVA_CLASS_NAME
+        ] + self._build_java_args(routine_data, output_path)
+        
+        # Solo se lee stdout cuando trae el archivo FIT; stderr solo se decodifica si hay error
+        stdout = subprocess.PIPE if output_path == '-' else subprocess.DEVNULL
+        
+        # No registrar los argumentos: llevan nombres de rutina y pasos enviados por el usuario
+        logger.info(f"Ejecutando {JAVA_CLASS_NAME} ({len(routine_data.get('steps', []))} pasos)")
+        # Los hilos del worker esperan aquí turno en vez de arrancar más JVMs
+        with _java_slots:
+            returncode, fit_data, stderr = run_java_tool(run_cmd, stdout, JAVA_TIMEOUT)
+        
+        if returncode != 0:
+            stderr = stderr.decode('utf-8', 'replace')
+            logger.error(f"Error ejecutando Java: {stderr}")
+            raise RuntimeError(f"Error ejecutando código Java: {stderr}")
+        
+        return fit_data or b''
     
-    public static void main(String[] args) {{
-        try {{
-            createWorkout();
-            System.out.println("Archivo FIT generado exitosamente");
-        }} catch (Exception e) {{
-            System.err.println("Error: " + e.getMessage());
-            e.printStackTrace();
-            System.exit(1);
-        }}
-    }}
+    def _is_prebuilt(self) -> bool:
+        """Indicar si la clase compilada en el build existe y está al día con el código fuente"""
+        class_path = os.path.join(JAVA_CLASSES_DIR, f"{JAVA_CLASS_NAME}.class")
+        try:
+            return os.path.getmtime(class_path) >= os.path.getmtime(JAVA_SOURCE_PATH)
+        except OSError:
+            return False
     
-    public static void createWorkout() {{
-        ArrayList<WorkoutStepMesg> workoutSteps = new ArrayList<WorkoutStepMesg>();
-        
-        {steps_code_str}
+    def _ensure_compiled(self) -> str:
+        """
+        Compilar FitWorkoutGenerator.java la primera vez que se necesita
         
-        WorkoutMesg workoutMesg = new WorkoutMesg();
-        workoutMesg.setWktName("{routine_name}");
-        workoutMesg.setSport(Sport.GENERIC);
-        workoutMesg.setSubSport(SubSport.INVALID);
-        workoutMesg.setNumValidSteps(workoutSteps.size());
+        Solo ocurre si el build no dejó la clase en JAVA_CLASSES_DIR.
         
-        CreateWorkout(workoutMesg, workoutSteps);
-    }}
+        Returns:
+            str: Directorio con la clase compilada
+        """
+        with self._compile_lock:
+            if self._classes_dir is not None:
+                return self._classes_dir
+            
+            javac = find_java_tool('javac')
+            if javac is None:
+                raise RuntimeError("javac no está disponible y no hay clase compilada en el build")
+            
+            classes_dir = tempfile.mkdtemp(prefix='fit_java_')
+            compile_cmd = [
+                javac,
+                '-cp', self.fit_jar_path,
+                '-d', classes_dir,
+                JAVA_SOURCE_PATH
+            ]
+            
+            logger.info(f"Compilando código Java: {' '.join(compile_cmd)}")
+            returncode, _, stderr = run_java_tool(compile_cmd, subprocess.DEVNULL, JAVAC_TIMEOUT)
+            
+            if returncode != 0:
+                stderr = stderr.decode('utf-8', 'replace')
+                logger.error(f"Error compilando Java: {stderr}")
+                raise RuntimeError(f"Error compilando código Java: {stderr}")
+            
+            self._classes_dir = classes_dir
+            return classes_dir
     
-    public static void CreateWorkout(WorkoutMesg workoutMesg, ArrayList<WorkoutStepMesg> workoutSteps) {{
-        // The combination of file type, manufacturer id, product id, and serial number should be unique.
-        File filetype = File.WORKOUT;
-        short manufacturerId = Manufacturer.DEVELOPMENT;
-        short productId = 0;
-        Random random = new Random();
-        int serialNumber = random.nextInt();
-
-        // Every FIT file MUST contain a File ID message
-        FileIdMesg fileIdMesg = new FileIdMesg();
-        fileIdMesg.setType(filetype);
-        fileIdMesg.setManufacturer((int) manufacturerId);
-        fileIdMesg.setProduct((int) productId);
-        fileIdMesg.setTimeCreated(new DateTime(new Date()));
-        fileIdMesg.setSerialNumber((long) serialNumber);
-
-        // Create the output stream
-        FileEncoder encode;
-        String filename = "{output_path}";
-
-        try {{
-            encode = new FileEncoder(new java.io.File(filename), Fit.ProtocolVersion.V1_0);
-        }} catch (FitRuntimeException e) {{
-            System.err.println("Error opening file " + filename);
-            e.printStackTrace();
-            return;
-        }}
-
-        // Write the messages to the file, in the proper sequence
-        encode.write(fileIdMesg);
-        encode.write(workoutMesg);
-
-        for (WorkoutStepMesg workoutStep : workoutSteps) {{
-            encode.write(workoutStep);
-        }}
-
-        // Close the output stream
-        try {{
-            encode.close();
-        }} catch (FitRuntimeException e) {{
-            System.err.println("Error closing encode.");
-            e.printStackTrace();
-            return;
-        }}
-
-        System.out.println("Encoded FIT Workout File " + filename);
-    }}
+    def _build_java_args(self, routine_data: Dict[str, Any], output_path: str) -> List[str]:
+        """
+        Generar los argumentos del generador Java para una rutina
+        
+        Args:
+            routine_data: Datos de la rutina
+            output_path: Ruta donde guardar el archivo FIT
+        
+        Returns:
+            List[str]: Ruta de salida, nombre de la rutina y 5 argumentos por paso
+        """
+        args = [output_path, str(routine_data.get('routine_name', 'Workout'))]
+        for step in self._prepare_steps(routine_data.get('steps', [])):
+            args.extend(str(value) for value in step)
+        return args
     
-    private static WorkoutStepMesg CreateWorkoutStep(int messageIndex,
-                                                     String name,
-                                                     String notes,
-                                                     Intensity intensity,
-                                                     WktStepDuration durationType,
-                                                     Integer durationValue,
-                                                     WktStepTarget targetType,
-                                                     int targetValue) {{
-
-        WorkoutStepMesg workoutStepMesg = new WorkoutStepMesg();
-        workoutStepMesg.setMessageIndex(messageIndex);
-
-        if (name != null) {{
-            workoutStepMesg.setWktStepName(name);
-        }}
-
-        if (notes != null) {{
-            workoutStepMesg.setNotes(notes);
-        }}
-
-        if (durationType == WktStepDuration.INVALID) {{
-            return null;
-        }}
-
-        workoutStepMesg.setIntensity(intensity);
-        workoutStepMesg.setDurationType(durationType);
-
-        if (durationValue != null) {{
-            workoutStepMesg.setDurationValue((long) durationValue);
-        }}
-
-        workoutStepMesg.setTargetType(targetType);
-        workoutStepMesg.setTargetValue((long) targetValue);
-
-        return workoutStepMesg;
-    }}
-}}
-"""
-        return java_code
+    def _prepare_steps(self, steps: List[Dict[str, Any]]) -> List[tuple]:
+        """
+        Normalizar los pasos de la rutina antes de pasarlos al generador Java
+        
+        Recorre los diccionarios de entrada una sola vez, de modo que la
+        construcción de argumentos solo trabaja con tuplas ya convertidas.
+        
+        Args:
+            steps: Pasos tal como llegan en routine_data
+        
+        Returns:
+            List[tuple]: (step_name, duration_type, duration_value, target_type, target_value)
+        """
+        prepared = []
+        for i, step in enumerate(steps):
+            # Solo construir el nombre por defecto si el paso no trae uno
+            step_name = step.get('name')
+            if step_name is None:
+                step_name = f'Step {i+1}'
+            # El tipo se normaliza una sola vez por paso
+            step_type = str(step.get('type', 'time')).lower()
+            step_value = step.get('value', '60')
+            
+            # Convertir tipo y valor según el formato del SDK
+            prepared.append((step_name,) + self._convert_step_params(step_type, step_value))
+        
+        return prepared
     
     def _convert_step_params(self, step_type: str, step_value: str) -> tuple:
         """
         Convertir parámetros del paso a formato del SDK de Java
         
         Args:
-            step_type: Tipo del paso (time, distance, reps)
+            step_type: Tipo del paso en minúsculas (time, distance, reps)
             step_value: Valor del paso
         
         Returns:
@@ -323,20 +321,14 @@ class FitWorkoutGenerator {{
         except (ValueError, TypeError):
             value = 60  # Valor por defecto
         
-        if step_type.lower() == 'time':
-            # Tiempo en segundos
-            return "WktStepDuration.TIME", value, "WktStepTarget.OPEN", 0
-        elif step_type.lower() == 'distance':
-            # Distancia en metros (convertir de km si es necesario)
-            if value < 100:  # Probablemente en km
-                value = value * 1000
-            return "WktStepDuration.DISTANCE", value, "WktStepTarget.OPEN", 0
-        elif step_type.lower() in ['reps', 'repetitions']:
-            # Repeticiones
-            return "WktStepDuration.REPS", value, "WktStepTarget.OPEN", 0
-        else:
-            # Por defecto: tiempo
-            return "WktStepDuration.TIME", value, "WktStepTarget.OPEN", 0
+        # Tipo de duración del SDK; por defecto: tiempo en segundos
+        duration_type = STEP_DURATION_TYPES.get(step_type, "TIME")
+        
+        if duration_type == "DISTANCE" and value < 100:
+            # Distancia en metros (probablemente llegó en km)
+            value = value * 1000
+        
+        return duration_type, value, "OPEN", 0
 
 
 def test_wrapper():
@@ -6,8 +6,21 @@ bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
 backlog = 2048
 
 # Worker processes
-workers = 1
-worker_class = "sync"
+# Regla estándar de gunicorn (2 * CPU + 1), ajustable con WEB_CONCURRENCY. La afinidad
+# respeta el pinning de CPU (taskset, --cpuset-cpus), pero no las cuotas de tiempo de
+# CPU (docker --cpus, Render): ahí conviene fijar WEB_CONCURRENCY. macOS no tiene
+# sched_getaffinity. Con preload_app el wrapper se crea antes del fork y los workers
+# lo comparten
+if hasattr(os, 'sched_getaffinity'):
+    cpu_count = len(os.sched_getaffinity(0))
+else:
+    cpu_count = os.cpu_count() or 1
+workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count * 2 + 1))
+worker_class = "gthread"
+# Los hilos atienden caché y 304 mientras esperan; las JVM simultáneas por worker
+# las limita JAVA_MAX_PROCESSES (fit_java_wrapper.py), así que el total de JVM del
+# servidor llega a workers * JAVA_MAX_PROCESSES
+threads = int(os.environ.get('THREADS', 8))
 worker_connections = 1000
 timeout = 120
 keepalive = 2
@@ -7,4 +7,4 @@ echo "Archivos disponibles:"
 ls -la
 
 # Ejecutar Gunicorn con el módulo correcto
-exec gunicorn --bind 0.0.0.0:$PORT --timeout 120 --workers 1 api_service:app
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py api_service:app
\ No newline at end of file